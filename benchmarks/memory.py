@@ -0,0 +1,78 @@
+"""
+Peak RSS of dirtocgen against the size of the tree, with and without
+--max_memory. Run from the project root:
+
+    python benchmarks/memory.py [NUMBER_OF_DOCUMENTS ...]
+
+Trees are built by child processes, since on Linux a process inherits the
+peak RSS of its parent at fork, which would hide that of dirtocgen.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+FANOUT = 20
+
+
+def build_tree(root: Path, number_of_documents: int):
+    """Directories of FANOUT documents and FANOUT subdirectories, breadth-first"""
+    (root / "README.md").write_text("# Root\n")
+    directories = [root]
+    created = 0
+    while created < number_of_documents:
+        directory = directories.pop(0)
+        for i in range(FANOUT):
+            (directory / f"doc{i}.md").write_text(f"# Document {created}\n")
+            created += 1
+        for i in range(FANOUT):
+            subdirectory = directory / f"dir{i}"
+            subdirectory.mkdir()
+            directories.append(subdirectory)
+
+
+def build_tree_in_child_process(root: Path, number_of_documents: int):
+    subprocess.run(
+        [sys.executable, __file__, "--build", str(root), str(number_of_documents)],
+        check=True,
+    )
+
+
+def peak_rss_kib(args: list[str]) -> int:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "dirtocgen", *args],
+        cwd=PROJECT_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _, status, rusage = os.wait4(process.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"dirtocgen failed: {args}")
+    return rusage.ru_maxrss
+
+
+def main():
+    if sys.argv[1:2] == ["--build"]:
+        build_tree(Path(sys.argv[2]), int(sys.argv[3]))
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    options = ["--root_toc_max_depth", "2", "--toc_max_depth", "1"]
+
+    print(f"{'documents':>10} {'default (KiB)':>14} {'--max_memory 1M (KiB)':>22}")
+    for size in sizes:
+        with TemporaryDirectory() as tmpd:
+            build_tree_in_child_process(Path(tmpd), size)
+            default = peak_rss_kib([tmpd, *options])
+
+        with TemporaryDirectory() as tmpd:
+            build_tree_in_child_process(Path(tmpd), size)
+            bounded = peak_rss_kib([tmpd, *options, "--max_memory", "1M"])
+
+        print(f"{size:>10} {default:>14} {bounded:>22}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Time of rerunning dirtocgen on a tree already processed, without and with
+--index, and with --index after one document has changed. Run from the
+project root:
+
+    python benchmarks/rerun.py [NUMBER_OF_DOCUMENTS ...]
+"""
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from memory import build_tree_in_child_process
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+# best of these runs, to be less sensitive to noise
+RUNS = 3
+
+
+def run_seconds(args: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "dirtocgen", *args],
+        cwd=PROJECT_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def rerun_seconds(args: list[str], before_each=None) -> float:
+    run_seconds(args)
+    seconds = []
+    for i in range(RUNS):
+        if before_each is not None:
+            before_each(i)
+        seconds.append(run_seconds(args))
+    return min(seconds)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 20_000]
+    options = ["--root_toc_max_depth", "2", "--toc_max_depth", "1"]
+
+    print(
+        f"{'documents':>10} {'default (s)':>12} {'--index (s)':>12} {'changed (s)':>12}"
+    )
+    for size in sizes:
+        with TemporaryDirectory() as tmpd:
+            root = Path(tmpd) / "root"
+            root.mkdir()
+            build_tree_in_child_process(root, size)
+            default = rerun_seconds([str(root), *options])
+
+            index_options = [str(root), *options, "--index", f"{tmpd}/index.sqlite"]
+            indexed = rerun_seconds(index_options)
+
+            def change_document(i):
+                (root / "dir0" / "doc0.md").write_text(f"# Changed {i}\n")
+
+            changed = rerun_seconds(index_options, change_document)
+
+        print(f"{size:>10} {default:>12.2f} {indexed:>12.2f} {changed:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import json
+import math
+import os
+from dataclasses import dataclass
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import IO, Callable, Iterator
+
+from dirtocgen.content_path import (
+    ContentPath,
+    Entry,
+    FileKey,
+    Scanner,
+    TocOrder,
+    toc_line,
+)
+
+
+def as_depth(max_depth: int | None) -> float:
+    """Max depth of toc as a number, where None or 0 means unlimited"""
+    return max_depth if max_depth else math.inf
+
+
+class Fragment:
+    """
+    Toc lines of a subtree as (depth, title, path) relative to its directory.
+    Kept in memory until its store spills it into a temporary file.
+    """
+
+    def __init__(self, store: "FragmentStore"):
+        self._store = store
+        self._file: IO[str] = StringIO()
+        # characters held in memory
+        self.size = 0
+        self.spilled = False
+
+    def append(self, depth: int, title: str, path: str):
+        # JSON escapes newlines, which paths and titles may have
+        line = json.dumps([depth, title, path], ensure_ascii=False) + "\n"
+        self._file.write(line)
+        if not self.spilled:
+            self.size += len(line)
+            self._store.grow(len(line))
+
+    def spill(self):
+        assert isinstance(self._file, StringIO)
+        f = TemporaryFile("w+", encoding="utf-8")
+        f.write(self._file.getvalue())
+        self._file = f
+        self.spilled = True
+
+    def lines(self) -> Iterator[tuple[int, str, str]]:
+        self._file.seek(0)
+        for line in self._file:
+            depth, title, path = json.loads(line)
+            yield depth, title, path
+        self._file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self._file.close()
+        self._store.release(self)
+
+
+class FragmentStore:
+    """
+    Fragments sharing a budget of memory (counted in characters). When the
+    budget is exceeded, the largest fragments are spilled into temporary files.
+    """
+
+    def __init__(self, max_memory: int):
+        self.max_memory = max_memory
+        self.in_memory = 0
+        self._fragments: list[Fragment] = []
+
+    def new(self) -> Fragment:
+        fragment = Fragment(self)
+        self._fragments.append(fragment)
+        return fragment
+
+    def grow(self, size: int):
+        self.in_memory += size
+        while self.in_memory > self.max_memory and self._fragments:
+            # at most one fragment per directory on the current path
+            largest = max(self._fragments, key=lambda f: f.size)
+            largest.spill()
+            self.release(largest)
+
+    def release(self, fragment: Fragment):
+        if fragment in self._fragments:
+            self._fragments.remove(fragment)
+            self.in_memory -= fragment.size
+
+
+@dataclass
+class CompletedDirectory:
+    """A directory whose subtree has been walked"""
+
+    path: Path
+    has_index_doc: bool
+    toc_max_depth: float
+    # toc lines relative to the directory
+    fragment: Fragment
+
+    def render_toc(self) -> str:
+        return "\n".join(
+            toc_line(title, path, depth)
+            for depth, title, path in self.fragment.lines()
+            if depth <= self.toc_max_depth
+        )
+
+
+@dataclass
+class _Frame:
+    directory: CompletedDirectory
+    key: FileKey
+    entries: Iterator[Entry]
+    depth: int
+    # depth of lines the ancestors and the directory itself need from it
+    need: float
+
+
+def walk_post_order(
+    scanner: Scanner,
+    store: FragmentStore,
+    root_dir: Path,
+    root_toc_max_depth: int | None,
+    toc_max_depth: int | None,
+    order: TocOrder = TocOrder.LEXICAL,
+    on_entry: Callable[[Entry, int, str], None] | None = None,
+) -> Iterator[CompletedDirectory]:
+    """
+    Walk the root depth-first and yield each directory once its subtree has
+    been walked, with toc lines of the subtree. Only directories on the
+    current path are kept, and their toc lines are limited to the depths
+    which they or their ancestors need. Lines of a yielded directory are
+    merged into its parent after the caller resumes the walk.
+
+    on_entry(entry, depth, title) is called for each entry in toc order.
+    """
+    real_root = os.path.realpath(root_dir)
+    # only symbolic links followed are remembered, to visit their targets once
+    followed: set[FileKey] = set()
+    ancestors: list[FileKey] = []
+    stack: list[_Frame] = []
+
+    def push(path, key, depth, max_depth, need):
+        children = scanner.children(path, key)
+        has_index_doc = any(child.path.name == "README.md" for child in children)
+        entries = iter(scanner.toc_candidates(children, order))
+        directory = CompletedDirectory(path, has_index_doc, max_depth, store.new())
+        stack.append(_Frame(directory, key, entries, depth, need))
+        ancestors.append(key)
+        return has_index_doc
+
+    root_depth = as_depth(root_toc_max_depth)
+    push(root_dir, Scanner.key_of(root_dir), 0, root_depth, root_depth)
+
+    while stack:
+        frame = stack[-1]
+        entry = next(frame.entries, None)
+
+        if entry is None:
+            stack.pop()
+            ancestors.pop()
+            yield frame.directory
+
+            fragment = frame.directory.fragment
+            if stack:
+                parent = stack[-1]
+                name = frame.directory.path.name
+                for depth, title, path in fragment.lines():
+                    if depth + 1 <= parent.need:
+                        parent.directory.fragment.append(
+                            depth + 1, title, f"{name}/{path}"
+                        )
+            fragment.close()
+            continue
+
+        if ContentPath(entry.path).is_hidden():
+            continue
+
+        depth = frame.depth + 1
+        if entry.is_dir:
+            if not scanner.should_visit(entry, real_root, followed, ancestors):
+                continue
+            if entry.is_symlink:
+                followed.add(entry.key)
+
+            toc_depth = as_depth(toc_max_depth)
+            need = max(toc_depth, frame.need - 1)
+            has_index_doc = push(entry.path, entry.key, depth, toc_depth, need)
+            # index docs to be created have the names of their directories
+            title = scanner.title(entry) if has_index_doc else entry.path.name
+        else:
+            title = scanner.title(entry)
+
+        frame.directory.fragment.append(1, title, entry.path.name)
+        if on_entry is not None:
+            on_entry(entry, depth, title)
@@ -0,0 +1,259 @@
+import argparse
+import sys
+
+
+def _parse_root(spec: str) -> tuple[str, int | None, int | None]:
+    """
+    Parse PATH[:ROOT_TOC_MAX_DEPTH[:TOC_MAX_DEPTH]] into its fields. Only
+    trailing integer (or empty) fields are taken as depths, so that a path
+    containing a colon still works.
+    """
+    path = spec
+    depths: list[int | None] = []
+    while len(depths) < 2:
+        head, sep, tail = path.rpartition(":")
+        if not sep or not (tail == "" or tail.isdigit()):
+            break
+        depths.insert(0, int(tail) if tail else None)
+        path = head
+
+    # fields absent from the spec are returned as None and filled with defaults
+    depths += [None] * (2 - len(depths))
+    return path, depths[0], depths[1]
+
+
+def _shard_spec(spec: str) -> str:
+    index, sep, count = spec.partition("/")
+    if not (sep and index.isdigit() and count.isdigit() and int(index) < int(count)):
+        raise argparse.ArgumentTypeError(f"should be i/N with 0 <= i < N: {spec}")
+    return spec
+
+
+def _size(spec: str) -> int:
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    number, unit = spec, 1
+    if spec[-1:].upper() in units:
+        number, unit = spec[:-1], units[spec[-1].upper()]
+    if not number.isdigit():
+        raise argparse.ArgumentTypeError(f"should be a size like 64M: {spec}")
+    return int(number) * unit
+
+
+def _open_output(filename: str):
+    if filename == "-":
+        import contextlib
+
+        return contextlib.nullcontext(sys.stdout)
+
+    return open(filename, "w")
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="dirtocgen")
+    parser.add_argument(
+        "path",
+        type=str,
+        nargs="+",
+        help=(
+            "root directory, optionally with its own depths as "
+            "PATH[:ROOT_TOC_MAX_DEPTH[:TOC_MAX_DEPTH]]"
+        ),
+    )
+    parser.add_argument(
+        "--root_toc_max_depth",
+        type=int,
+        help="maximum depth of toc (table of contents) in the root directory",
+    )
+    parser.add_argument(
+        "--toc_max_depth",
+        type=int,
+        help="maximum depth of toc (table of contents) in each directory",
+    )
+    parser.add_argument(
+        "--symlink_policy",
+        choices=["skip", "follow-once"],
+        default="skip",
+        help=(
+            "skip symbolic links to directories, or follow each one once "
+            "when it points outside of the root"
+        ),
+    )
+    parser.add_argument(
+        "--order",
+        choices=["lexical", "natural", "title"],
+        default="lexical",
+        help="order of entries in toc; natural compares numbers by value",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="write the scanned tree to this file ('-' for stdout)",
+    )
+    parser.add_argument(
+        "--manifest_format",
+        choices=["json", "ndjson"],
+        default="json",
+        help="format of the manifest",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_shard_spec,
+        metavar="i/N",
+        help=(
+            "process only the subtrees assigned to the i-th of N shards "
+            "(0 <= i < N), leaving the roots to `dirtocgen merge`; "
+            "requires --manifest"
+        ),
+    )
+    parser.add_argument(
+        "--max_memory",
+        type=_size,
+        metavar="SIZE",
+        help=(
+            "process the tree depth-first, keeping toc lines in memory up to "
+            "SIZE (e.g. 64M) and spilling the rest to temporary files"
+        ),
+    )
+    parser.add_argument(
+        "--index",
+        type=str,
+        metavar="FILE",
+        help=(
+            "SQLite database of the tree, kept up to date to speed up reruns "
+            "and to be queried by other tools"
+        ),
+    )
+    args = parser.parse_args(argv)
+    if args.index is not None and (args.shard or args.max_memory is not None):
+        parser.error("--index cannot be used with --shard or --max_memory")
+    if args.shard is not None and args.manifest is None:
+        parser.error("--shard requires --manifest")
+    if args.shard is not None and args.max_memory is not None:
+        parser.error("--shard cannot be used with --max_memory")
+    return args
+
+
+def _parse_merge_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="dirtocgen merge",
+        description="update tocs of the roots from manifests of all shards",
+    )
+    parser.add_argument(
+        "path",
+        type=str,
+        nargs="+",
+        help="root directory, optionally as PATH[:ROOT_TOC_MAX_DEPTH]",
+    )
+    parser.add_argument(
+        "--manifests",
+        type=str,
+        nargs="+",
+        required=True,
+        help="manifests written by the shards",
+    )
+    parser.add_argument(
+        "--root_toc_max_depth",
+        type=int,
+        help="maximum depth of toc (table of contents) in the root directory",
+    )
+    parser.add_argument(
+        "--order",
+        choices=["lexical", "natural", "title"],
+        default="lexical",
+        help="order of entries in toc; should be the same as the shards",
+    )
+    return parser.parse_args(argv)
+
+
+def _roots(specs, root_toc_max_depth, toc_max_depth):
+    from dirtocgen.usecase import Root
+
+    roots = []
+    for spec in specs:
+        path, root_depth, depth = _parse_root(spec)
+        if root_depth is None:
+            root_depth = root_toc_max_depth
+        if depth is None:
+            depth = toc_max_depth
+        roots.append(Root(path, root_depth, depth))
+
+    return roots
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv[:1] == ["merge"]:
+        args = _parse_merge_args(argv[1:])
+        run = _merge
+    else:
+        args = _parse_args(argv)
+        run = _run
+
+    # imported here so that `--help` and plain imports of this module stay cheap
+    from logging import INFO, basicConfig
+
+    basicConfig(level=INFO)
+    run(args)
+
+
+def _run(args):
+    from dirtocgen.content_path import SymlinkPolicy, TocOrder
+    from dirtocgen.usecase import (
+        insert_or_update_tocs_of_roots,
+        insert_or_update_tocs_of_roots_bounded,
+    )
+
+    roots = _roots(args.path, args.root_toc_max_depth, args.toc_max_depth)
+    symlink_policy = SymlinkPolicy(args.symlink_policy)
+    order = TocOrder(args.order)
+
+    def run(manifest=None):
+        if args.index is not None:
+            from dirtocgen.index import Index
+
+            with Index(args.index) as index:
+                insert_or_update_tocs_of_roots(
+                    roots, symlink_policy, order, manifest, index=index
+                )
+        elif args.max_memory is not None:
+            insert_or_update_tocs_of_roots_bounded(
+                roots, args.max_memory, symlink_policy, order, manifest
+            )
+        elif args.shard is not None:
+            from dirtocgen.shard import Shard
+
+            insert_or_update_tocs_of_roots(
+                roots, symlink_policy, order, manifest, Shard.parse(args.shard)
+            )
+        else:
+            insert_or_update_tocs_of_roots(roots, symlink_policy, order, manifest)
+
+    if args.manifest is None:
+        run()
+        return
+
+    from dirtocgen.manifest import ManifestFormat, ManifestWriter
+
+    with _open_output(args.manifest) as f:
+        run(ManifestWriter(f, ManifestFormat(args.manifest_format)))
+
+
+def _merge(args):
+    from itertools import chain
+
+    from dirtocgen.content_path import TocOrder
+    from dirtocgen.manifest import read_manifest
+    from dirtocgen.usecase import MergeError, merge_root_tocs
+
+    roots = _roots(args.path, args.root_toc_max_depth, None)
+    files = [open(filename) for filename in args.manifests]
+    try:
+        entries = chain.from_iterable(read_manifest(f) for f in files)
+        merge_root_tocs(roots, entries, TocOrder(args.order))
+    except MergeError as e:
+        sys.exit(f"dirtocgen merge: error: {e}")
+    finally:
+        for f in files:
+            f.close()
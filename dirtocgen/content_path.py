@@ -1,5 +1,17 @@
+import os
 import re
+from enum import Enum
+from logging import getLogger
 from pathlib import Path
+from stat import S_ISDIR
+from typing import Callable, Iterator, NamedTuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where runs are not locked
+    fcntl = None  # type: ignore[assignment]
+
+logger = getLogger(__name__)
 
 
 class TitleNotFoundError(Exception):
@@ -10,6 +22,371 @@ class UpdateTocError(Exception):
     """Failed to update toc"""
 
 
+class ConcurrentUpdateError(Exception):
+    """The document kept being changed by others while updating toc"""
+
+
+_TOC_PATTERN = r"\[//\]: # \(dirtocgen start\)[\s\S]+\[//\]: # \(dirtocgen end\)"
+
+# times to retry a rewrite when the document is changed under it
+_MAX_REWRITE_ATTEMPTS = 3
+
+
+class SymlinkPolicy(str, Enum):
+    """How symbolic links to directories are treated while walking"""
+
+    SKIP = "skip"
+    FOLLOW_ONCE = "follow-once"
+
+
+class TocOrder(str, Enum):
+    """Order of siblings in toc"""
+
+    LEXICAL = "lexical"
+    # numbers in names are compared by value, e.g. chapter2 < chapter10
+    NATURAL = "natural"
+    TITLE = "title"
+
+
+FileKey = tuple[int, int]
+
+
+class Entry(NamedTuple):
+    path: Path
+    is_dir: bool
+    is_symlink: bool
+    # (st_dev, st_ino) of the real file or directory
+    key: FileKey
+
+
+class Scanner:
+    """
+    Cache of directory listings and titles, which lets several toc generations
+    (even of different root directories) share one walk of the file system.
+
+    Directories and documents are identified by (st_dev, st_ino), so that
+    each real directory is listed once and each document is read once, however
+    many paths lead to it.
+
+    With SymlinkPolicy.SKIP, symbolic links to directories are ignored. With
+    SymlinkPolicy.FOLLOW_ONCE, they are followed when they point outside of
+    the walked root and to a directory not visited yet in the walk; links
+    back to an ancestor are reported as loops and skipped.
+
+    With cache=False nothing is kept, for trees too large to be held in memory.
+    """
+
+    def __init__(self, symlink_policy: SymlinkPolicy = SymlinkPolicy.SKIP, cache=True):
+        self.symlink_policy = symlink_policy
+        self.cache = cache
+        self._children: dict[FileKey, list[tuple[str, bool, bool, FileKey]]] = {}
+        self._toc_children: dict[tuple[FileKey, TocOrder], list[Entry]] = {}
+        self._titles: dict[FileKey, str | None] = {}
+        self._mtimes: dict[FileKey, float] = {}
+
+    @staticmethod
+    def key_of(path: str | Path) -> FileKey:
+        st = os.stat(path)
+        return st.st_dev, st.st_ino
+
+    def entry_of(self, path: str | Path) -> Entry:
+        path = Path(path)
+        st = os.stat(path)
+        key = st.st_dev, st.st_ino
+        if self.cache:
+            self._mtimes[key] = st.st_mtime
+        return Entry(path, S_ISDIR(st.st_mode), path.is_symlink(), key)
+
+    def mtime(self, entry: Entry) -> float:
+        if entry.key in self._mtimes:
+            return self._mtimes[entry.key]
+
+        try:
+            mtime = os.stat(entry.path).st_mtime
+        except OSError:  # broken link
+            mtime = os.lstat(entry.path).st_mtime
+        if self.cache:
+            self._mtimes[entry.key] = mtime
+        return mtime
+
+    def children(self, directory: Path, key: FileKey | None = None) -> list[Entry]:
+        if key is None:
+            key = self.key_of(directory)
+
+        if key in self._children:
+            children = self._children[key]
+        else:
+            children = self._scan(directory, key[0])
+            if self.cache:
+                self._children[key] = children
+
+        return [
+            Entry(directory / name, is_dir, is_symlink, child_key)
+            for name, is_dir, is_symlink, child_key in children
+        ]
+
+    @staticmethod
+    def _scan(directory: Path, dev: int) -> list[tuple[str, bool, bool, FileKey]]:
+        children = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                is_dir = entry.is_dir()
+                is_symlink = entry.is_symlink()
+                # inode() of a plain file is known without an extra stat call
+                key = dev, entry.inode()
+                if is_dir or is_symlink:
+                    try:
+                        st = entry.stat()
+                        key = st.st_dev, st.st_ino
+                    except OSError:  # broken link
+                        pass
+                children.append((entry.name, is_dir, is_symlink, key))
+
+        return sorted(children)
+
+    def toc_children(
+        self, directory: Path, key: FileKey, order: TocOrder = TocOrder.LEXICAL
+    ) -> list[Entry]:
+        """
+        Children which can appear in toc, i.e. directories and markdown
+        documents except index docs, in the given order.
+        """
+        cache_key = key, order
+        if cache_key not in self._toc_children:
+            entries = self.toc_candidates(self.children(directory, key), order)
+            if not self.cache:
+                return entries
+            self._toc_children[cache_key] = entries
+
+        return [
+            entry._replace(path=directory / entry.path.name)
+            for entry in self._toc_children[cache_key]
+        ]
+
+    def toc_candidates(self, children: list[Entry], order: TocOrder) -> list[Entry]:
+        """Select children which can appear in toc and sort them"""
+        entries = [
+            entry
+            for entry in children
+            if entry.is_dir
+            or (entry.path.suffix == ".md" and entry.path.name != "README.md")
+        ]
+        # children are already in lexical order
+        if order is not TocOrder.LEXICAL:
+            entries = sorted(entries, key=self._sort_key_function(order))
+
+        return entries
+
+    def _sort_key_function(self, order: TocOrder):
+        return lambda entry: toc_sort_key(
+            order, entry.path.name, lambda: self.title(entry)
+        )
+
+    def walk(
+        self,
+        directory: Path,
+        max_depth: int | None = None,
+        ignore_hidden=True,
+        order: TocOrder = TocOrder.LEXICAL,
+        prune: Callable[[Entry, int], bool] | None = None,
+    ) -> Iterator[tuple[Entry, int]]:
+        """
+        Yield directories and markdown documents (except index docs) under
+        the directory in depth-first order, with their depth from it.
+        Siblings are sorted per directory in the given order. Entries for
+        which prune(entry, depth) is true are skipped with their descendants.
+        """
+        key = self.key_of(directory)
+        # only needed for symbolic links followed
+        real_root = None
+        if self.symlink_policy is SymlinkPolicy.FOLLOW_ONCE:
+            real_root = os.path.realpath(directory)
+        visited = {key}
+        yield from self._walk(
+            directory,
+            key,
+            1,
+            max_depth,
+            ignore_hidden,
+            order,
+            prune,
+            real_root,
+            visited,
+            [key],
+        )
+
+    def _walk(
+        self,
+        directory,
+        key,
+        depth,
+        max_depth,
+        ignore_hidden,
+        order,
+        prune,
+        real_root,
+        visited,
+        ancestors,
+    ):
+        for entry in self.toc_children(directory, key, order):
+            if ignore_hidden and ContentPath(entry.path).is_hidden():
+                continue
+
+            if prune is not None and prune(entry, depth):
+                continue
+
+            if entry.is_dir:
+                if not self.should_visit(entry, real_root, visited, ancestors):
+                    continue
+                visited.add(entry.key)
+
+            yield entry, depth
+
+            if entry.is_dir and not (max_depth and depth >= max_depth):
+                ancestors.append(entry.key)
+                yield from self._walk(
+                    entry.path,
+                    entry.key,
+                    depth + 1,
+                    max_depth,
+                    ignore_hidden,
+                    order,
+                    prune,
+                    real_root,
+                    visited,
+                    ancestors,
+                )
+                ancestors.pop()
+
+    def should_visit(self, entry, real_root, visited, ancestors) -> bool:
+        if entry.is_symlink and self.symlink_policy is SymlinkPolicy.SKIP:
+            return False
+
+        if entry.key in ancestors:
+            logger.warning(f"skip symlink loop: {entry.path}")
+            return False
+
+        if entry.key in visited:
+            return False
+
+        if entry.is_symlink:
+            # the real directory inside the root is visited through its own path
+            real_path = os.path.realpath(entry.path)
+            if os.path.commonpath([real_root, real_path]) == real_root:
+                return False
+
+        return True
+
+    def title(self, entry: Entry) -> str:
+        """
+        Title of the entry, or its stem if the title cannot be read.
+        """
+        title = self.header(entry)
+        return entry.path.stem if title is None else title
+
+    def header(self, entry: Entry) -> str | None:
+        """Header of the document of the entry, or None if not found"""
+        if entry.key in self._titles:
+            return self._titles[entry.key]
+
+        doc_path = entry.path / "README.md" if entry.is_dir else entry.path
+        try:
+            title = ContentPath._get_header(doc_path)
+        except (FileNotFoundError, TitleNotFoundError):
+            title = None
+        if self.cache:
+            self._titles[entry.key] = title
+        return title
+
+    def set_title(self, key: FileKey, title: str | None):
+        self._titles[key] = title
+
+    def has_child(self, directory: Path, key: FileKey, name: str) -> bool:
+        return any(entry.path.name == name for entry in self.children(directory, key))
+
+
+def _insert_toc_text(text: str, toc_text: str) -> str:
+    lines = text.splitlines(keepends=True)
+    lines.insert(1, "\n" + toc_text + "\n")
+    return "".join(lines)
+
+
+def _update_toc_text(text: str, toc_text: str) -> str:
+    # a function as the replacement keeps backslashes in titles as they are
+    text_updated, number_of_subs_made = re.subn(_TOC_PATTERN, lambda _: toc_text, text)
+    if number_of_subs_made == 0:
+        raise UpdateTocError
+    return text_updated
+
+
+def _file_version(st: os.stat_result) -> tuple[int, int, int]:
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _rewrite(path: str | Path, transform: Callable[[str], str], initial_text=""):
+    """
+    Replace text of the file with transform(text), holding an exclusive
+    advisory lock so that concurrent dirtocgen runs do not lose updates.
+    The write is skipped when the file has been changed since it was read
+    (by a writer not taking the lock), or replaced with another file (as
+    editors save), and retried from the new text.
+
+    An empty file is taken as not written yet, e.g. just created by another
+    run, and initial_text is transformed instead.
+    """
+    for _ in range(_MAX_REWRITE_ATTEMPTS):
+        with open(path, "r+") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+            version = _file_version(os.fstat(f.fileno()))
+            text = f.read()
+            text_updated = transform(text or initial_text)
+
+            if _file_version(os.fstat(f.fileno())) != version:
+                continue
+            # the lock and the writes go to the opened file, not to the path
+            if _file_version(os.stat(path)) != version:
+                continue
+            if text_updated == text:
+                return
+
+            f.seek(0)
+            f.write(text_updated)
+            f.truncate()
+            return
+
+    raise ConcurrentUpdateError(path)
+
+
+def natural_sort_key(name: str) -> list[int | str]:
+    """
+    Sort key comparing runs of digits by value and the others case-insensitively
+    """
+    return [
+        int(token) if i % 2 else token.casefold()
+        for i, token in enumerate(re.split(r"(\d+)", name))
+    ]
+
+
+def toc_sort_key(order: TocOrder, name: str, title: Callable[[], str]):
+    """
+    Sort key of an entry named `name` among its siblings. `title` is called
+    only when ordering by title.
+    """
+    if order is TocOrder.NATURAL:
+        return natural_sort_key(name), name
+    if order is TocOrder.TITLE:
+        return title().casefold(), name
+
+    return name
+
+
+def toc_line(title: str, relative_path: str | Path, depth: int) -> str:
+    indent = "".join([" " * (depth - 1) * 2])
+    return f"{indent}* [{title}]({relative_path})"
+
+
 class ContentPath:
     def __init__(self, path: str | Path):
         if isinstance(path, str):
@@ -48,66 +425,78 @@ class ContentPath:
         except ValueError as e:
             raise e
 
-    def generate_toc(self, max_depth: int | None = None, ignore_hidden=True) -> str:
+    def generate_toc(
+        self,
+        max_depth: int | None = None,
+        ignore_hidden=True,
+        scanner: Scanner | None = None,
+        order: TocOrder = TocOrder.LEXICAL,
+    ) -> str:
         if not self.path.is_dir():
             raise ValueError(f"{self.path} is not a directory")
 
+        if scanner is None:
+            scanner = Scanner()
+
         root_dir = self.path
         toc_lines: list[str] = []
 
-        for path in sorted(root_dir.glob("**/*")):
-            if path.is_file():
-                if path.suffix != ".md" or path.name == "README.md":
-                    continue
-
-            c = ContentPath(path)
-            if ignore_hidden and c.is_hidden():
-                continue
+        for entry, depth in scanner.walk(root_dir, max_depth, ignore_hidden, order):
+            title = scanner.title(entry)
+            toc_lines.append(toc_line(title, entry.path.relative_to(root_dir), depth))
 
-            depth = c.depth_from(root_dir)
-            if max_depth and depth > max_depth:
-                continue
+        return "\n".join(toc_lines)
 
-            try:
-                title = c.title()
-            except (FileNotFoundError, TitleNotFoundError):
-                title = path.stem
+    def create_index_doc(self):
+        self._create_index_doc(self._index_doc_header())
 
-            indent = "".join([" " * (depth - 1) * 2])
-            toc_line = f"{indent}* [{title}]({path.relative_to(root_dir)})"
-            toc_lines.append(toc_line)
+    def create_index_doc_with_toc(self, *args, **kwargs):
+        """
+        Create the index doc with its toc at once, instead of creating it and
+        then inserting toc into it
+        """
+        toc_text = self._generate_toc_text(*args, **kwargs)
+        self._create_index_doc(_insert_toc_text(self._index_doc_header(), toc_text))
 
-        return "\n".join(toc_lines)
+    def _index_doc_header(self) -> str:
+        return f"# {self.path.name}\n"
 
-    def create_index_doc(self):
-        if not self.path.is_dir():
+    def _create_index_doc(self, text: str):
+        index_doc = self.path / "README.md"
+        try:
+            # fails if the file already exists
+            with open(index_doc, "x") as f:
+                # others may rewrite the file as soon as it exists, see _rewrite()
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                f.write(text)
+                f.truncate()
+        except (FileNotFoundError, NotADirectoryError):
             raise ValueError(f"{self.path} is not a directory")
 
-        index_doc = self.path / "README.md"
-        index_doc.touch(exist_ok=False)
-        with open(index_doc, "w") as f:
-            title = self.path.name
-            f.write(f"# {title}\n")
+    def _initial_text(self) -> str:
+        """Text of the document not written yet"""
+        return self._index_doc_header() if self.path.is_dir() else ""
 
     def insert_toc(self, *args, **kwargs):
         path = self.doc_path()
         self._insert_toc(path, *args, **kwargs)
 
     def _insert_toc(self, path, *args, **kwargs):
-        with open(path, "r") as f:
-            lines = f.readlines()
-
         toc_text = self._generate_toc_text(*args, **kwargs)
-        lines.insert(1, "\n" + toc_text + "\n")
+        _rewrite(
+            path, lambda text: _insert_toc_text(text, toc_text), self._initial_text()
+        )
 
-        with open(path, "w") as f:
-            f.writelines(lines)
+    def _generate_toc_text(self, *args, toc: str | None = None, **kwargs):
+        # toc may be given already rendered, e.g. from manifests
+        if toc is None:
+            toc = self.generate_toc(*args, **kwargs)
 
-    def _generate_toc_text(self, *args, **kwargs):
         return (
             f"[//]: # (dirtocgen start)\n"
             f"\n"
-            f"{self.generate_toc(*args, **kwargs)}\n"
+            f"{toc}\n"
             f"\n"
             f"[//]: # (dirtocgen end)"
         )
@@ -117,17 +506,27 @@ class ContentPath:
         self._update_toc(path, *args, **kwargs)
 
     def _update_toc(self, path, *args, **kwargs):
-        with open(path, "r") as f:
-            text = f.read()
-
         toc_text = self._generate_toc_text(*args, **kwargs)
-        pattern = r"\[//\]: # \(dirtocgen start\)[\s\S]+\[//\]: # \(dirtocgen end\)"
-        text_updated, number_of_subs_made = re.subn(pattern, toc_text, text)
-        if number_of_subs_made == 0:
-            raise UpdateTocError
+        _rewrite(path, lambda text: _update_toc_text(text, toc_text))
+
+    def insert_or_update_toc(self, *args, **kwargs) -> bool:
+        """
+        Update toc if the document has one, otherwise insert it. Unlike calling
+        has_toc() and then update_toc() or insert_toc(), the check is done
+        while the document is locked. Return whether toc was inserted.
+        """
+        toc_text = self._generate_toc_text(*args, **kwargs)
+        inserted = False
 
-        with open(path, "w") as f:
-            f.write(text_updated)
+        def transform(text):
+            nonlocal inserted
+            inserted = re.search(_TOC_PATTERN, text) is None
+            if inserted:
+                return _insert_toc_text(text, toc_text)
+            return _update_toc_text(text, toc_text)
+
+        _rewrite(self.doc_path(), transform, self._initial_text())
+        return inserted
 
     def has_toc(self):
         path = self.doc_path()
@@ -138,7 +537,6 @@ class ContentPath:
         with open(path, "r") as f:
             text = f.read()
 
-        pattern = r"\[//\]: # \(dirtocgen start\)[\s\S]+\[//\]: # \(dirtocgen end\)"
-        result = re.search(pattern, text)
+        result = re.search(_TOC_PATTERN, text)
 
         return result is not None
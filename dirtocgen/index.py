@@ -0,0 +1,302 @@
+import hashlib
+import os
+import sqlite3
+from dataclasses import dataclass, field
+from itertools import chain
+from pathlib import Path
+from typing import Iterable
+
+from dirtocgen.content_path import (
+    Entry,
+    Scanner,
+    TocOrder,
+    toc_line,
+    toc_sort_key,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    -- header of the document (the index doc for a directory), NULL if none
+    title TEXT,
+    -- of the document (the index doc for a directory), NULL if none
+    mtime_ns INTEGER,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+CREATE INDEX IF NOT EXISTS entries_title ON entries (title);
+
+CREATE TABLE IF NOT EXISTS tocs (
+    -- directory whose index doc has the toc
+    path TEXT PRIMARY KEY,
+    -- max depth and order the toc was rendered with
+    params TEXT NOT NULL,
+    toc_hash TEXT NOT NULL,
+    -- of the index doc after the toc was written
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class IndexedEntry:
+    path: str
+    parent: str
+    kind: str
+    title: str | None
+    mtime_ns: int | None
+    size: int | None
+
+    def display_title(self) -> str:
+        """Title as in toc, falling back to the stem like Scanner.title()"""
+        return Path(self.path).stem if self.title is None else self.title
+
+
+@dataclass
+class Changes:
+    """Differences between the tree and the index, found by Index.reconcile()"""
+
+    # new or changed since the last run
+    entries: list[Entry] = field(default_factory=list)
+    # paths of entries removed since the last run
+    removed: list[str] = field(default_factory=list)
+    # directories with new, changed or removed entries under them
+    dirty: set[str] = field(default_factory=set)
+
+    def is_dirty(self, directory: str | Path) -> bool:
+        return os.path.abspath(directory) in self.dirty
+
+    def _mark_changed(self, path: str, root: str):
+        # an entry changes the tocs of its ancestors, not its own
+        directory = os.path.dirname(path)
+        while directory not in self.dirty and _is_under(directory, root):
+            self.dirty.add(directory)
+            directory = os.path.dirname(directory)
+
+
+def _toc_hash(toc: str) -> str:
+    return hashlib.sha1(toc.encode()).hexdigest()
+
+
+def _toc_params(max_depth: int | None, order: TocOrder) -> str:
+    return f"{max_depth or 0}:{order.value}"
+
+
+def _under(directory: str) -> tuple[str, tuple[int, str]]:
+    """SQL condition and parameters for paths under the directory"""
+    prefix = directory.rstrip("/") + "/"
+    return "substr(path, 1, ?) = ?", (len(prefix), prefix)
+
+
+def _is_under(path: str, directory: str) -> bool:
+    """Whether the path is the directory or under it"""
+    return path == directory or path.startswith(directory.rstrip("/") + "/")
+
+
+def _doc_stat(entry: Entry) -> tuple[int | None, int | None]:
+    """mtime_ns and size of the document of the entry, None if not found"""
+    doc_path = entry.path / "README.md" if entry.is_dir else entry.path
+    try:
+        st = os.stat(doc_path)
+    except OSError:
+        return None, None
+    return st.st_mtime_ns, st.st_size
+
+
+class Index:
+    """
+    SQLite database of the directories and documents found by the scans,
+    keyed by absolute paths. It lets reruns skip reading titles of documents
+    and rendering tocs which have not changed, and other tools query the
+    tree without walking it.
+    """
+
+    def __init__(self, filename: str | Path):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(_SCHEMA)
+        # rows of tocs by path, loaded at once when first needed
+        self._tocs: dict[str, tuple] | None = None
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def reconcile(self, scanner: Scanner, root_dirs: Iterable[str | Path]) -> Changes:
+        """
+        Compare the trees under the roots with the entries of the last run by
+        the stats of their documents. Titles of the entries unchanged are given
+        to the scanner, so that they are not read again.
+        """
+        changes = Changes()
+        for root_dir in root_dirs:
+            root = os.path.abspath(root_dir)
+            condition, parameters = _under(root)
+            rows = self.connection.execute(
+                "SELECT path, kind, title, mtime_ns, size FROM entries "
+                f"WHERE path = ? OR {condition}",
+                (root, *parameters),
+            )
+            stored = {path: tuple(row) for path, *row in rows}
+
+            walked = (entry for entry, _ in scanner.walk(Path(root_dir)))
+            for entry in chain([scanner.entry_of(root_dir)], walked):
+                path = os.path.abspath(entry.path)
+                row = stored.pop(path, None)
+                kind = "directory" if entry.is_dir else "document"
+                if row is not None and (row[0], *row[2:]) == (kind, *_doc_stat(entry)):
+                    scanner.set_title(entry.key, row[1])
+                else:
+                    changes.entries.append(entry)
+                    changes._mark_changed(path, root)
+
+            for path in stored:
+                changes.removed.append(path)
+                changes._mark_changed(path, root)
+
+        return changes
+
+    def is_toc_current(
+        self,
+        directory: str | Path,
+        max_depth: int | None,
+        order: TocOrder,
+        toc: str | None = None,
+    ) -> bool:
+        """
+        Whether the index doc has the toc rendered with max_depth and order
+        (if given, the same one), unchanged since it was written
+        """
+        if self._tocs is None:
+            rows = self.connection.execute(
+                "SELECT path, params, toc_hash, mtime_ns, size FROM tocs"
+            )
+            self._tocs = {path: tuple(row) for path, *row in rows}
+
+        row = self._tocs.get(os.path.abspath(directory))
+        if row is None or row[0] != _toc_params(max_depth, order):
+            return False
+        if toc is not None and row[1] != _toc_hash(toc):
+            return False
+
+        try:
+            st = os.stat(Path(directory) / "README.md")
+        except FileNotFoundError:
+            return False
+        return (st.st_mtime_ns, st.st_size) == tuple(row[2:])
+
+    def record_toc(
+        self, directory: str | Path, max_depth: int | None, order: TocOrder, toc: str
+    ):
+        st = os.stat(Path(directory) / "README.md")
+        path = os.path.abspath(directory)
+        row = _toc_params(max_depth, order), _toc_hash(toc), st.st_mtime_ns, st.st_size
+        self.connection.execute(
+            "INSERT OR REPLACE INTO tocs VALUES (?, ?, ?, ?, ?)", (path, *row)
+        )
+        if self._tocs is not None:
+            self._tocs[path] = row
+
+    def update(
+        self,
+        scanner: Scanner,
+        changes: Changes,
+        written: Iterable[str | Path] = (),
+    ):
+        """
+        Apply the changes found by reconcile() to the index, along with the
+        directories whose index docs have been written since then
+        """
+        entries = chain(changes.entries, (scanner.entry_of(d) for d in written))
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM entries WHERE path = ?",
+                ((path,) for path in changes.removed),
+            )
+            self.connection.executemany(
+                "DELETE FROM tocs WHERE path = ?",
+                ((path,) for path in changes.removed),
+            )
+            if self._tocs is not None:
+                for path in changes.removed:
+                    self._tocs.pop(path, None)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self._row(scanner, entry) for entry in entries),
+            )
+
+    @staticmethod
+    def _row(scanner: Scanner, entry: Entry) -> tuple:
+        path = os.path.abspath(entry.path)
+        return (
+            path,
+            os.path.dirname(path),
+            "directory" if entry.is_dir else "document",
+            scanner.header(entry),
+            *_doc_stat(entry),
+        )
+
+    def _select(self, where: str, parameters: tuple) -> list[IndexedEntry]:
+        rows = self.connection.execute(
+            f"SELECT * FROM entries WHERE {where} ORDER BY path", parameters
+        )
+        return [IndexedEntry(*row) for row in rows]
+
+    def children(self, directory: str | Path) -> list[IndexedEntry]:
+        return self._select("parent = ?", (os.path.abspath(directory),))
+
+    def documents_under(
+        self, directory: str | Path, max_depth: int | None = None
+    ) -> list[IndexedEntry]:
+        """Documents under the directory, down to max_depth from it"""
+        directory = os.path.abspath(directory)
+        condition, parameters = _under(directory)
+        entries = self._select(f"kind = 'document' AND {condition}", parameters)
+        if not max_depth:
+            return entries
+
+        return [
+            entry
+            for entry in entries
+            if len(Path(entry.path).relative_to(directory).parts) <= max_depth
+        ]
+
+    def find_title(self, title: str) -> list[IndexedEntry]:
+        return self._select("title = ?", (title,))
+
+    def generate_toc(
+        self,
+        directory: str | Path,
+        max_depth: int | None = None,
+        order: TocOrder = TocOrder.LEXICAL,
+    ) -> str:
+        """
+        Same toc as ContentPath.generate_toc() as of the last scan, without
+        reading the file system
+        """
+        directory = os.path.abspath(directory)
+        toc_lines: list[str] = []
+
+        def visit(parent: str, depth: int):
+            children = sorted(
+                self.children(parent),
+                key=lambda e: toc_sort_key(
+                    order, os.path.basename(e.path), e.display_title
+                ),
+            )
+            for entry in children:
+                relative_path = os.path.relpath(entry.path, directory)
+                toc_lines.append(toc_line(entry.display_title(), relative_path, depth))
+                if entry.kind == "directory" and not (max_depth and depth >= max_depth):
+                    visit(entry.path, depth + 1)
+
+        visit(directory, 1)
+        return "\n".join(toc_lines)
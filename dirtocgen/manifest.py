@@ -0,0 +1,123 @@
+import json
+from dataclasses import asdict, dataclass
+from enum import Enum
+from itertools import chain
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Iterator
+
+from dirtocgen.content_path import Scanner, TocOrder
+
+if TYPE_CHECKING:
+    from dirtocgen.shard import Shard
+
+
+class ManifestFormat(str, Enum):
+    JSON = "json"
+    # one JSON object per line, written while walking
+    NDJSON = "ndjson"
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    """A directory or a document found in the scan"""
+
+    root: str
+    # relative to the root, "." for the root itself
+    path: str
+    depth: int
+    title: str
+    kind: str
+    mtime: float
+    # "i/N" if written by the i-th of N shards
+    shard: str | None = None
+
+
+def scan_manifest_entries(
+    scanner: Scanner,
+    root_dir: str | Path,
+    ignore_hidden=True,
+    order: TocOrder = TocOrder.LEXICAL,
+    shard: "Shard | None" = None,
+) -> Iterator[ManifestEntry]:
+    """
+    Yield the root directory and everything that can appear in its toc, using
+    titles and listings already cached in the scanner. With a shard, only its
+    subtrees are yielded, besides the root.
+    """
+    root_dir = Path(root_dir)
+    root = str(root_dir)
+    prune = None if shard is None else shard.prune
+    shard_spec = None if shard is None else str(shard)
+    root_entry = scanner.entry_of(root_dir)
+    yield ManifestEntry(
+        root,
+        ".",
+        0,
+        scanner.title(root_entry),
+        "directory",
+        scanner.mtime(root_entry),
+        shard_spec,
+    )
+
+    for entry, depth in scanner.walk(
+        root_dir, ignore_hidden=ignore_hidden, order=order, prune=prune
+    ):
+        yield ManifestEntry(
+            root,
+            entry.path.relative_to(root_dir).as_posix(),
+            depth,
+            scanner.title(entry),
+            "directory" if entry.is_dir else "document",
+            scanner.mtime(entry),
+            shard_spec,
+        )
+
+
+class ManifestWriter:
+    """
+    Writer of manifest entries into a file object. Entries are written as they
+    come in either format, so that the manifest is not held in memory.
+    """
+
+    def __init__(self, file: IO[str], format: ManifestFormat = ManifestFormat.JSON):
+        self.file = file
+        self.format = format
+        self._count = 0
+
+    def write(self, entry: ManifestEntry):
+        if self.format is ManifestFormat.NDJSON:
+            self.file.write(json.dumps(_record(entry), ensure_ascii=False) + "\n")
+        else:
+            # same layout as json.dump() of the whole array with indent=2; newlines
+            # within the entry are only the ones from indentation
+            text = json.dumps(_record(entry), ensure_ascii=False, indent=2)
+            self.file.write("[\n  " if self._count == 0 else ",\n  ")
+            self.file.write(text.replace("\n", "\n  "))
+        self._count += 1
+
+    def close(self):
+        if self.format is ManifestFormat.JSON:
+            self.file.write("[]\n" if self._count == 0 else "\n]\n")
+
+        self.file.flush()
+
+
+def _record(entry: ManifestEntry) -> dict:
+    record = asdict(entry)
+    # only manifests of shards have it
+    if record["shard"] is None:
+        del record["shard"]
+    return record
+
+
+def read_manifest(file: IO[str]) -> Iterator[ManifestEntry]:
+    """Read entries written by ManifestWriter in either format"""
+    first_line = file.readline()
+    if first_line.lstrip().startswith("["):
+        for record in json.loads(first_line + file.read()):
+            yield ManifestEntry(**record)
+        return
+
+    for line in chain([first_line], file):
+        if line.strip():
+            yield ManifestEntry(**json.loads(line))
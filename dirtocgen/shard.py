@@ -0,0 +1,39 @@
+import re
+import zlib
+from dataclasses import dataclass
+
+from dirtocgen.content_path import Entry
+
+
+@dataclass(frozen=True)
+class Shard:
+    """
+    The i-th of N shards (0 <= i < N). Subtrees directly under a root are
+    assigned to shards by a hash of their names, which does not depend on
+    the machine, the run or the rest of the tree.
+    """
+
+    index: int
+    count: int
+
+    def __post_init__(self):
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"invalid shard: {self.index}/{self.count}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        result = re.fullmatch(r"(\d+)/(\d+)", spec)
+        if result is None:
+            raise ValueError(f"shard should be given as i/N: {spec}")
+        return cls(int(result.group(1)), int(result.group(2)))
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def owns(self, name: str) -> bool:
+        """Whether the subtree named `name` directly under a root is ours"""
+        return zlib.crc32(name.encode()) % self.count == self.index
+
+    def prune(self, entry: Entry, depth: int) -> bool:
+        """Prune function for Scanner.walk, skipping subtrees of other shards"""
+        return depth == 1 and not self.owns(entry.path.name)
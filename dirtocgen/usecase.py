@@ -1,38 +1,347 @@
-from logging import INFO, basicConfig, getLogger
+import os
+from logging import getLogger
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, NamedTuple
 
-from dirtocgen.content_path import ContentPath
+from dirtocgen.content_path import (
+    ContentPath,
+    FileKey,
+    Scanner,
+    SymlinkPolicy,
+    TocOrder,
+    toc_line,
+    toc_sort_key,
+)
+
+# optional subsystems are imported where they are used, so that plain runs
+# do not pay for them
+if TYPE_CHECKING:
+    from dirtocgen.index import Index
+    from dirtocgen.manifest import ManifestEntry, ManifestWriter
+    from dirtocgen.shard import Shard
 
 logger = getLogger(__name__)
-basicConfig(level=INFO)
+
+
+class MergeError(Exception):
+    """Manifests given to merge do not cover the roots"""
+
+
+class Root(NamedTuple):
+    """Root directory of a documentation tree with its own toc depths"""
+
+    path: str | Path
+    root_toc_max_depth: int | None = 1
+    toc_max_depth: int | None = 1
 
 
 def insert_or_update_root_toc_and_create_or_update_children_index_docs(
     root_dir: str | Path, root_toc_max_depth=1, toc_max_depth=1
 ):
-    root_dir = Path(root_dir)
-    root = ContentPath(root_dir)
-    _insert_or_update_toc(root, max_depth=root_toc_max_depth)
+    insert_or_update_tocs_of_roots([Root(root_dir, root_toc_max_depth, toc_max_depth)])
+
+
+def insert_or_update_tocs_of_roots(
+    roots: Iterable[Root],
+    symlink_policy: SymlinkPolicy = SymlinkPolicy.SKIP,
+    order: TocOrder = TocOrder.LEXICAL,
+    manifest: "ManifestWriter | None" = None,
+    shard: "Shard | None" = None,
+    index: "Index | None" = None,
+):
+    """
+    Process several roots in one run, walking each directory once and
+    sharing titles between them. A directory covered by more than one root
+    (nested roots, or reached through symbolic links) is written once, with
+    the depth of the innermost root.
+
+    If a manifest writer is given, the scanned tree of each root is written
+    to it from the same scan.
+
+    If a shard is given, only the subtrees of the roots assigned to it are
+    walked and written, and so is the manifest. The index docs of the roots
+    themselves are left to merge_root_tocs.
+
+    If an index is given, the trees are reconciled with it by the stats of
+    their documents: titles of documents unchanged since the last run are
+    taken from it, and tocs are neither rendered nor written for directories
+    with nothing changed under them. The index is then updated with the
+    changes.
+    """
+    roots = list(roots)
+    _check_index_docs_of_roots(roots)
+    scanner = Scanner(symlink_policy)
+    plan = _plan_max_depths(roots, scanner, shard)
 
-    for path in root_dir.glob("**/*"):
-        if not path.is_dir():
+    changes = None
+    if index is not None:
+        root_paths = [os.path.abspath(root.path) for root in roots]
+        # nested roots are covered by their outer ones
+        changes = index.reconcile(
+            scanner,
+            [
+                p
+                for p in root_paths
+                if not any(p.startswith(f"{q}/") for q in root_paths)
+            ],
+        )
+
+    # index docs to be created are known from the listings, and so are their
+    # titles, which are needed by the tocs of their parents
+    missing = {
+        key
+        for key, (path, _) in plan.items()
+        if not scanner.has_child(path, key, "README.md")
+    }
+    for key in missing:
+        scanner.set_title(key, plan[key][0].name)
+
+    written: list[Path] = []
+    for key, (path, max_depth) in plan.items():
+        if (
+            index is not None
+            and changes is not None
+            and key not in missing
+            and not changes.is_dirty(path)
+            and index.is_toc_current(path, max_depth, order)
+        ):
             continue
 
         c = ContentPath(path)
-        if c.is_hidden():
+        toc = c.generate_toc(max_depth=max_depth, scanner=scanner, order=order)
+        if (
+            index is not None
+            and key not in missing
+            and index.is_toc_current(path, max_depth, order, toc)
+        ):
+            continue
+
+        if not (key in missing and _create_index_doc_with_toc(c, toc=toc)):
+            _insert_or_update_toc(c, toc=toc)
+
+        if index is not None:
+            index.record_toc(path, max_depth, order, toc)
+            written.append(path)
+
+    if index is not None and changes is not None:
+        index.update(scanner, changes, written)
+
+    if manifest is not None:
+        from dirtocgen.manifest import scan_manifest_entries
+
+        for root in roots:
+            for entry in scan_manifest_entries(
+                scanner, root.path, order=order, shard=shard
+            ):
+                manifest.write(entry)
+        manifest.close()
+
+
+def insert_or_update_tocs_of_roots_bounded(
+    roots: Iterable[Root],
+    max_memory: int,
+    symlink_policy: SymlinkPolicy = SymlinkPolicy.SKIP,
+    order: TocOrder = TocOrder.LEXICAL,
+    manifest: "ManifestWriter | None" = None,
+):
+    """
+    Same as insert_or_update_tocs_of_roots, but for trees too large to be held
+    in memory. Each root is walked depth-first, keeping only the directories
+    on the current path, and toc lines for their ancestors are held within
+    max_memory characters, beyond which they are spilled to temporary files.
+
+    Nothing is shared between roots: nested roots are processed from the
+    outermost, so that the innermost one wins, as in the ordinary mode.
+    """
+    from dirtocgen.bounded import FragmentStore, walk_post_order
+
+    roots = list(roots)
+    _check_index_docs_of_roots(roots)
+    scanner = Scanner(symlink_policy, cache=False)
+    store = FragmentStore(max_memory)
+
+    for root in sorted(roots, key=lambda r: len(Path(r.path).resolve().parts)):
+        root_dir = Path(root.path)
+        on_entry = None
+        if manifest is not None:
+            manifest.write(_root_manifest_entry(scanner, root_dir))
+            on_entry = _manifest_entry_writer(manifest, root_dir, scanner)
+
+        for directory in walk_post_order(
+            scanner,
+            store,
+            root_dir,
+            root.root_toc_max_depth,
+            root.toc_max_depth,
+            order,
+            on_entry,
+        ):
+            c = ContentPath(directory.path)
+            toc = directory.render_toc()
+            if directory.has_index_doc or not _create_index_doc_with_toc(c, toc=toc):
+                _insert_or_update_toc(c, toc=toc)
+
+    if manifest is not None:
+        manifest.close()
+
+
+def _root_manifest_entry(scanner: Scanner, root_dir: Path) -> "ManifestEntry":
+    from dirtocgen.manifest import ManifestEntry
+
+    entry = scanner.entry_of(root_dir)
+    return ManifestEntry(
+        str(root_dir), ".", 0, scanner.title(entry), "directory", scanner.mtime(entry)
+    )
+
+
+def _manifest_entry_writer(
+    manifest: "ManifestWriter", root_dir: Path, scanner: Scanner
+):
+    from dirtocgen.manifest import ManifestEntry
+
+    def write(entry, depth, title):
+        manifest.write(
+            ManifestEntry(
+                str(root_dir),
+                entry.path.relative_to(root_dir).as_posix(),
+                depth,
+                title,
+                "directory" if entry.is_dir else "document",
+                scanner.mtime(entry),
+            )
+        )
+
+    return write
+
+
+def _plan_max_depths(
+    roots: Iterable[Root], scanner: Scanner, shard: "Shard | None" = None
+) -> dict[FileKey, tuple[Path, int | None]]:
+    """
+    Map each directory to be processed to its path and the max depth of its
+    toc, in the order of processing: each root followed by its descendants.
+    """
+    root_dirs = {Scanner.key_of(root.path): root for root in roots}
+    plan: dict[FileKey, tuple[Path, int | None]] = {}
+
+    def prune(entry, depth):
+        # nested roots are planned by their own walks
+        if entry.key in root_dirs:
+            return True
+        return shard is not None and shard.prune(entry, depth)
+
+    for key, root in root_dirs.items():
+        root_dir = Path(root.path)
+        if shard is None:
+            plan[key] = (root_dir, root.root_toc_max_depth)
+
+        for entry, _ in scanner.walk(root_dir, prune=prune):
+            if entry.is_dir:
+                plan[entry.key] = (entry.path, root.toc_max_depth)
+
+    return plan
+
+
+def merge_root_tocs(
+    roots: Iterable[Root],
+    entries: Iterable["ManifestEntry"],
+    order: TocOrder = TocOrder.LEXICAL,
+):
+    """
+    Insert or update tocs of the roots from the manifests written by all the
+    shards, without walking the roots. Roots are matched with the manifest
+    entries by their real paths, so the shards and the merge should run in
+    the same directory if the roots are given as relative paths.
+
+    MergeError is raised before any toc is written, unless the manifests of
+    all the shards are given for every root.
+    """
+    roots = list(roots)
+    _check_index_docs_of_roots(roots)
+    subtrees: dict[str, dict[str, list["ManifestEntry"]]] = {
+        os.path.realpath(root.path): {} for root in roots
+    }
+    shards: dict[str, set[str | None]] = {root_path: set() for root_path in subtrees}
+    seen: set[tuple[str, str]] = set()
+
+    for entry in entries:
+        root_path = os.path.realpath(entry.root)
+        if root_path not in subtrees:
+            continue
+        shards[root_path].add(entry.shard)
+        # every shard writes the same entry of the root
+        if entry.depth == 0 or (root_path, entry.path) in seen:
             continue
+        seen.add((root_path, entry.path))
 
-        if not c.doc_path().exists():
-            c.create_index_doc()
-            logger.info(f"create index doc: {c.doc_path()}")
+        top = entry.path.split("/", 1)[0]
+        subtrees[root_path].setdefault(top, []).append(entry)
 
-        _insert_or_update_toc(c, max_depth=toc_max_depth)
+    for root in roots:
+        _check_shards(root, shards[os.path.realpath(root.path)])
+
+    for root in roots:
+        groups = subtrees[os.path.realpath(root.path)]
+        # entries in a subtree are already in order since the shard walked it
+        tops = sorted(
+            groups,
+            key=lambda top: toc_sort_key(order, top, lambda: groups[top][0].title),
+        )
+        max_depth = root.root_toc_max_depth
+        toc = "\n".join(
+            toc_line(entry.title, entry.path, entry.depth)
+            for top in tops
+            for entry in groups[top]
+            if not (max_depth and entry.depth > max_depth)
+        )
+
+        _insert_or_update_toc(ContentPath(root.path), toc=toc)
+
+
+def _check_shards(root: Root, specs: set[str | None]):
+    """Check that the manifests of all the shards are given for the root"""
+    from dirtocgen.shard import Shard
+
+    if not specs:
+        raise MergeError(f"no manifest entries for root: {root.path}")
+    if None in specs:
+        raise MergeError(f"manifest not written by a shard for root: {root.path}")
+
+    shards = [Shard.parse(spec) for spec in specs if spec is not None]
+    counts = {shard.count for shard in shards}
+    if len(counts) > 1:
+        raise MergeError(f"manifests of different numbers of shards: {root.path}")
+
+    (count,) = counts
+    missing = set(range(count)) - {shard.index for shard in shards}
+    if missing:
+        specs_missing = ", ".join(f"{i}/{count}" for i in sorted(missing))
+        raise MergeError(
+            f"manifests of shards missing for {root.path}: {specs_missing}"
+        )
+
+
+def _check_index_docs_of_roots(roots: list[Root]):
+    """Index docs are created for directories under the roots, not for roots"""
+    for root in roots:
+        index_doc = Path(root.path) / "README.md"
+        if not index_doc.is_file():
+            raise FileNotFoundError(f"index doc of root not found: {index_doc}")
+
+
+def _create_index_doc_with_toc(c: ContentPath, *args, **kwargs) -> bool:
+    """Return False if the index doc turns out to exist, e.g. made by others"""
+    try:
+        c.create_index_doc_with_toc(*args, **kwargs)
+    except FileExistsError:
+        return False
+
+    logger.info(f"create index doc: {c.path / 'README.md'}")
+    return True
 
 
 def _insert_or_update_toc(c: ContentPath, *args, **kwargs):
-    if c.has_toc():
-        c.update_toc(*args, **kwargs)
-        logger.info(f"update toc: {c.path}")
-    else:
-        c.insert_toc(*args, **kwargs)
+    if c.insert_or_update_toc(*args, **kwargs):
         logger.info(f"insert toc: {c.path}")
+    else:
+        logger.info(f"update toc: {c.path}")
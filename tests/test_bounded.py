@@ -0,0 +1,56 @@
+import unittest
+
+from bounded import FragmentStore
+
+
+class TestFragmentStore(unittest.TestCase):
+    def test_lines(self):
+        store = FragmentStore(max_memory=1 << 20)
+        fragment = store.new()
+        fragment.append(1, "Title", "doc.md")
+        fragment.append(2, "Nested", "dir/doc.md")
+
+        expect = [(1, "Title", "doc.md"), (2, "Nested", "dir/doc.md")]
+        self.assertEqual(expect, list(fragment.lines()))
+        self.assertFalse(fragment.spilled)
+
+    def test_lines_with_newlines(self):
+        for max_memory in [1 << 20, 0]:
+            with self.subTest(max_memory=max_memory):
+                store = FragmentStore(max_memory)
+                fragment = store.new()
+                self.addCleanup(fragment.close)
+                fragment.append(1, "Title\nnext", "dir\n/a\nb.md")
+
+                expect = [(1, "Title\nnext", "dir\n/a\nb.md")]
+                self.assertEqual(expect, list(fragment.lines()))
+
+    def test_spill_largest_fragment_over_budget(self):
+        store = FragmentStore(max_memory=30)
+        small = store.new()
+        large = store.new()
+        self.addCleanup(large.close)
+        small.append(1, "a", "a.md")
+        large.append(1, "Large title", "large.md")
+        large.append(1, "Large title", "large.md")
+
+        self.assertTrue(large.spilled)
+        self.assertFalse(small.spilled)
+        self.assertLessEqual(store.in_memory, 30)
+        # contents are kept after spilled, and can be appended further
+        large.append(1, "After", "after.md")
+        self.assertEqual(
+            [
+                (1, "Large title", "large.md"),
+                (1, "Large title", "large.md"),
+                (1, "After", "after.md"),
+            ],
+            list(large.lines()),
+        )
+
+    def test_close_releases_memory(self):
+        store = FragmentStore(max_memory=1 << 20)
+        fragment = store.new()
+        fragment.append(1, "Title", "doc.md")
+        fragment.close()
+        self.assertEqual(0, store.in_memory)
@@ -0,0 +1,20 @@
+import unittest
+
+from cli import _parse_root
+
+
+class TestParseRoot(unittest.TestCase):
+    def test_path_only(self):
+        self.assertEqual(("docs", None, None), _parse_root("docs"))
+
+    def test_root_toc_max_depth(self):
+        self.assertEqual(("docs", 2, None), _parse_root("docs:2"))
+
+    def test_both_depths(self):
+        self.assertEqual(("docs", 2, 3), _parse_root("docs:2:3"))
+
+    def test_empty_depth_falls_back_to_default(self):
+        self.assertEqual(("docs", None, 3), _parse_root("docs::3"))
+
+    def test_path_containing_colon(self):
+        self.assertEqual(("a:b/docs", 1, None), _parse_root("a:b/docs:1"))
@@ -1,9 +1,20 @@
 import os
+import threading
 import unittest
 from pathlib import Path
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 
-from content_path import ContentPath, TitleNotFoundError, UpdateTocError
+from content_path import (
+    ConcurrentUpdateError,
+    ContentPath,
+    Scanner,
+    SymlinkPolicy,
+    TitleNotFoundError,
+    TocOrder,
+    UpdateTocError,
+    _rewrite,
+    natural_sort_key,
+)
 
 
 class TestContentPath(unittest.TestCase):
@@ -208,6 +219,121 @@ class TestContentPath(unittest.TestCase):
             actual = sut.generate_toc()
             self.assertEqual(expect, actual)
 
+    def test_generate_toc_shares_titles_through_scanner(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "dir1").mkdir()
+            doc = Path(tmpd) / "dir1" / "doc.md"
+            doc.write_text("# Document")
+
+            scanner = Scanner()
+            ContentPath(tmpd).generate_toc(scanner=scanner)
+
+            # titles already read are not read again from the file system
+            doc.write_text("# Renamed")
+            actual = ContentPath(Path(tmpd) / "dir1").generate_toc(scanner=scanner)
+            self.assertEqual("* [Document](doc.md)", actual)
+
+    def test_generate_toc_skips_symlinked_directory(self):
+        with TemporaryDirectory() as tmpd, TemporaryDirectory() as shared:
+            (Path(shared) / "doc.md").write_text("# Shared")
+            (Path(tmpd) / "dir1").mkdir()
+            (Path(tmpd) / "link").symlink_to(shared)
+
+            sut = ContentPath(tmpd)
+            actual = sut.generate_toc()  # SymlinkPolicy.SKIP by default
+            self.assertEqual("* [dir1](dir1)", actual)
+
+    def test_generate_toc_follows_symlinked_directory_once(self):
+        with TemporaryDirectory() as tmpd, TemporaryDirectory() as shared:
+            (Path(shared) / "doc.md").write_text("# Shared")
+            (Path(tmpd) / "link1").symlink_to(shared)
+            (Path(tmpd) / "link2").symlink_to(shared)
+
+            sut = ContentPath(tmpd)
+            scanner = Scanner(SymlinkPolicy.FOLLOW_ONCE)
+            actual = sut.generate_toc(scanner=scanner)
+            expect = (
+                "* [link1](link1)\n"
+                "  * [Shared](link1/doc.md)"
+                # link2 would not appear because it leads to the same directory
+            )
+            self.assertEqual(expect, actual)
+
+    def test_generate_toc_does_not_duplicate_directory_inside_root(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "b").mkdir()
+            (Path(tmpd) / "b" / "doc.md").write_text("# Document")
+            (Path(tmpd) / "a").symlink_to(Path(tmpd) / "b")
+
+            sut = ContentPath(tmpd)
+            scanner = Scanner(SymlinkPolicy.FOLLOW_ONCE)
+            actual = sut.generate_toc(scanner=scanner)
+            # fmt: off
+            expect = (
+                "* [b](b)\n"
+                "  * [Document](b/doc.md)"
+            )
+            # fmt: on
+            self.assertEqual(expect, actual)
+
+    def test_generate_toc_detects_symlink_loop(self):
+        with TemporaryDirectory() as tmpd:
+            root = Path(tmpd) / "root"
+            (root / "dir1").mkdir(parents=True)
+            # leads to the parent of the root, and thus back to the root
+            (root / "dir1" / "up").symlink_to(tmpd)
+
+            sut = ContentPath(root)
+            scanner = Scanner(SymlinkPolicy.FOLLOW_ONCE)
+            with self.assertLogs("content_path", level="WARNING"):
+                actual = sut.generate_toc(scanner=scanner)
+            # fmt: off
+            expect = (
+                "* [dir1](dir1)\n"
+                "  * [up](dir1/up)"
+            )
+            # fmt: on
+            self.assertEqual(expect, actual)
+
+    def test_generate_toc_in_natural_order(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "chapter10").mkdir()
+            (Path(tmpd) / "chapter2").mkdir()
+            (Path(tmpd) / "chapter2" / "section10.md").open("w+").close()
+            (Path(tmpd) / "chapter2" / "section9.md").open("w+").close()
+
+            sut = ContentPath(tmpd)
+            actual = sut.generate_toc(order=TocOrder.NATURAL)
+            expect = (
+                "* [chapter2](chapter2)\n"
+                "  * [section9](chapter2/section9.md)\n"
+                "  * [section10](chapter2/section10.md)\n"
+                "* [chapter10](chapter10)"
+            )
+            self.assertEqual(expect, actual)
+
+    def test_generate_toc_in_title_order(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "a.md").write_text("# Zebra")
+            (Path(tmpd) / "b.md").write_text("# apple")
+            (Path(tmpd) / "c").mkdir()
+
+            sut = ContentPath(tmpd)
+            actual = sut.generate_toc(order=TocOrder.TITLE)
+            # fmt: off
+            expect = (
+                "* [apple](b.md)\n"
+                "* [c](c)\n"
+                "* [Zebra](a.md)"
+            )
+            # fmt: on
+            self.assertEqual(expect, actual)
+
+    def test_natural_sort_key(self):
+        names = ["Chapter10", "chapter2", "chapter1b", "appendix"]
+        expect = ["appendix", "chapter1b", "chapter2", "Chapter10"]
+        self.assertEqual(expect, sorted(names, key=natural_sort_key))
+
     def test_generate_failed_with_not_directory(self):
         with NamedTemporaryFile() as tmpf:
             sut = ContentPath(tmpf.name)
@@ -236,6 +362,53 @@ class TestContentPath(unittest.TestCase):
             with self.assertRaises(FileExistsError):
                 sut.create_index_doc()
 
+    def test_create_index_doc_with_toc(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "doc.md").write_text("# Document")
+
+            sut = ContentPath(tmpd)
+            sut.create_index_doc_with_toc()
+
+            expect_body = (
+                f"# {os.path.basename(tmpd)}\n"
+                "\n"
+                "[//]: # (dirtocgen start)\n"
+                "\n"
+                "* [Document](doc.md)\n"
+                "\n"
+                "[//]: # (dirtocgen end)\n"
+            )
+            self.assertEqual(expect_body, (Path(tmpd) / "README.md").read_text())
+
+    def test_create_index_doc_with_toc_failed_when_file_already_exists(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "README.md").write_text("# Index")
+
+            sut = ContentPath(tmpd)
+            with self.assertRaises(FileExistsError):
+                sut.create_index_doc_with_toc()
+            self.assertEqual("# Index", (Path(tmpd) / "README.md").read_text())
+
+    def test_insert_or_update_toc_into_index_doc_being_created(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "doc.md").write_text("# Document")
+
+            sut = ContentPath(tmpd)
+            # created by another run, which has not written it yet
+            with open(Path(tmpd) / "README.md", "x"):
+                self.assertTrue(sut.insert_or_update_toc())
+
+            expect_body = (
+                f"# {os.path.basename(tmpd)}\n"
+                "\n"
+                "[//]: # (dirtocgen start)\n"
+                "\n"
+                "* [Document](doc.md)\n"
+                "\n"
+                "[//]: # (dirtocgen end)\n"
+            )
+            self.assertEqual(expect_body, (Path(tmpd) / "README.md").read_text())
+
     def test_create_index_doc_failed_with_file(self):
         with NamedTemporaryFile() as tmpf:
             sut = ContentPath(tmpf.name)
@@ -328,6 +501,103 @@ class TestContentPath(unittest.TestCase):
             with self.assertRaises(UpdateTocError):
                 sut.update_toc()
 
+    def test_insert_or_update_toc(self):
+        with TemporaryDirectory() as tmpd:
+            index_doc = Path(tmpd) / "README.md"
+            index_doc.write_text("# Document\n")
+            (Path(tmpd) / "dir1").mkdir()
+
+            sut = ContentPath(tmpd)
+            self.assertTrue(sut.insert_or_update_toc())  # inserted
+            self.assertFalse(sut.insert_or_update_toc())  # updated
+
+            expect_body = (
+                "# Document\n"
+                "\n"
+                "[//]: # (dirtocgen start)\n"
+                "\n"
+                "* [dir1](dir1)\n"
+                "\n"
+                "[//]: # (dirtocgen end)\n"
+            )
+            self.assertEqual(expect_body, index_doc.read_text())
+
+    def test_update_toc_waits_for_lock(self):
+        try:
+            import fcntl
+        except ImportError:
+            self.skipTest("fcntl is not available")
+
+        with TemporaryDirectory() as tmpd:
+            index_doc = Path(tmpd) / "README.md"
+            index_doc.write_text("# Document\n")
+
+            sut = ContentPath(tmpd)
+            with open(index_doc) as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                thread = threading.Thread(target=sut.insert_or_update_toc)
+                thread.start()
+                thread.join(timeout=0.2)
+
+                # blocked while another run holds the lock
+                self.assertTrue(thread.is_alive())
+                self.assertEqual("# Document\n", index_doc.read_text())
+
+            thread.join()
+            self.assertTrue(sut.has_toc())
+
+    def test_rewrite_retries_when_changed_by_others(self):
+        with NamedTemporaryFile("w") as tmpf:
+            tmpf.write("a\n")
+            tmpf.flush()
+
+            texts = []
+
+            def transform(text):
+                texts.append(text)
+                if len(texts) == 1:
+                    # another writer, which does not take the lock
+                    with open(tmpf.name, "a") as f:
+                        f.write("b\n")
+                return text + "c\n"
+
+            _rewrite(tmpf.name, transform)
+
+            self.assertEqual(["a\n", "a\nb\n"], texts)
+            with open(tmpf.name) as f:
+                self.assertEqual("a\nb\nc\n", f.read())
+
+    def test_rewrite_retries_when_replaced_by_others(self):
+        with TemporaryDirectory() as tmpd:
+            path = Path(tmpd) / "doc.md"
+            path.write_text("a\n")
+
+            texts = []
+
+            def transform(text):
+                texts.append(text)
+                if len(texts) == 1:
+                    # an editor saving to a temporary file and renaming it
+                    (Path(tmpd) / "doc.md.tmp").write_text("b\n")
+                    os.replace(Path(tmpd) / "doc.md.tmp", path)
+                return text + "c\n"
+
+            _rewrite(path, transform)
+
+            self.assertEqual(["a\n", "b\n"], texts)
+            self.assertEqual("b\nc\n", path.read_text())
+
+    def test_rewrite_failed_when_kept_changed_by_others(self):
+        with NamedTemporaryFile("w") as tmpf:
+
+            def transform(text):
+                with open(tmpf.name, "a") as f:
+                    f.write("b\n")
+                return text + "c\n"
+
+            with self.assertRaises(ConcurrentUpdateError):
+                _rewrite(tmpf.name, transform)
+
     def test_has_toc(self):
         with NamedTemporaryFile() as tmpf:
             with open(tmpf.name, "w") as f:
@@ -0,0 +1,134 @@
+import os
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import usecase
+from content_path import ContentPath
+from index import Index
+from usecase import Root, insert_or_update_tocs_of_roots
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        tmpd = TemporaryDirectory()
+        self.addCleanup(tmpd.cleanup)
+        self.root = Path(tmpd.name) / "root"
+        (self.root / "dir1" / "dir11").mkdir(parents=True)
+        (self.root / "README.md").write_text("# Root\n")
+        (self.root / "doc1.md").write_text("# Document 1\n")
+        (self.root / "dir1" / "doc2.md").write_text("# Document 2\n")
+        (self.root / "dir1" / "dir11" / "doc3.md").write_text("# Document 3\n")
+
+        self.index = Index(Path(tmpd.name) / "index.sqlite")
+        self.addCleanup(self.index.close)
+
+    def _run(self, root_toc_max_depth=2, toc_max_depth=1):
+        insert_or_update_tocs_of_roots(
+            [Root(self.root, root_toc_max_depth, toc_max_depth)], index=self.index
+        )
+
+    def test_documents_under(self):
+        self._run()
+
+        actual = [e.path for e in self.index.documents_under(self.root, max_depth=2)]
+        expect = [str(self.root / "dir1" / "doc2.md"), str(self.root / "doc1.md")]
+        self.assertEqual(expect, actual)
+
+    def test_find_title(self):
+        self._run()
+
+        actual = [e.path for e in self.index.find_title("Document 3")]
+        self.assertEqual([str(self.root / "dir1" / "dir11" / "doc3.md")], actual)
+
+    def test_generate_toc_without_reading_files(self):
+        self._run()
+
+        for max_depth in [None, 1, 2]:
+            with self.subTest(max_depth=max_depth):
+                expect = ContentPath(self.root).generate_toc(max_depth=max_depth)
+                self.assertEqual(
+                    expect, self.index.generate_toc(self.root, max_depth=max_depth)
+                )
+
+    def test_rerun_takes_titles_of_unchanged_documents_from_index(self):
+        self._run()
+
+        # change the title, but keep the size and the mtime
+        doc = self.root / "doc1.md"
+        st = doc.stat()
+        doc.write_text("# Document X\n")
+        os.utime(doc, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self._run()
+
+        self.assertIn("[Document 1](doc1.md)", (self.root / "README.md").read_text())
+
+    def test_rerun_does_not_rewrite_unchanged_index_docs(self):
+        self._run()
+
+        with patch.object(usecase.ContentPath, "insert_or_update_toc") as m:
+            self._run()
+
+        m.assert_not_called()
+
+    def test_rerun_rewrites_index_docs_changed_by_others(self):
+        self._run()
+        index_doc = self.root / "dir1" / "README.md"
+        index_doc.write_text("# Dir 1\n")
+
+        self._run()
+
+        self.assertIn("[Document 2](doc2.md)", index_doc.read_text())
+
+    def test_rerun_forgets_removed_documents(self):
+        self._run()
+        (self.root / "doc1.md").unlink()
+
+        self._run()
+
+        self.assertEqual([], self.index.find_title("Document 1"))
+
+    def test_rerun_neither_reads_nor_renders_unchanged_tree(self):
+        self._run()
+
+        with patch.object(usecase.ContentPath, "_get_header") as get_header:
+            with patch.object(usecase.ContentPath, "generate_toc") as generate_toc:
+                self._run()
+
+        get_header.assert_not_called()
+        generate_toc.assert_not_called()
+
+    def test_rerun_updates_tocs_of_ancestors_of_changed_document(self):
+        self._run(toc_max_depth=2)
+        (self.root / "dir1" / "dir11" / "doc3.md").write_text("# Document Y\n")
+
+        self._run(toc_max_depth=2)
+
+        self.assertIn(
+            "[Document Y](doc3.md)",
+            (self.root / "dir1" / "dir11" / "README.md").read_text(),
+        )
+        self.assertIn(
+            "[Document Y](dir11/doc3.md)",
+            (self.root / "dir1" / "README.md").read_text(),
+        )
+        self.assertEqual(
+            ["Document Y"], [e.title for e in self.index.find_title("Document Y")]
+        )
+
+    def test_rerun_with_other_depths_rewrites_index_docs(self):
+        self._run()
+
+        self._run(root_toc_max_depth=1)
+
+        self.assertNotIn("doc2.md", (self.root / "README.md").read_text())
+
+    def test_rerun_removes_documents_from_tocs(self):
+        self._run()
+        (self.root / "dir1" / "doc2.md").unlink()
+
+        self._run()
+
+        self.assertNotIn("doc2.md", (self.root / "dir1" / "README.md").read_text())
+        self.assertNotIn("doc2.md", (self.root / "README.md").read_text())
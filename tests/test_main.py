@@ -0,0 +1,85 @@
+import re
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# budget for the imports of a plain run, from `import dirtocgen.__main__` to the
+# end of main(), in microseconds. The console script runs on every commit via
+# pre-commit, so keep startup cheap.
+IMPORT_TIME_BUDGET_US = 70_000
+
+# modules of options which plain runs should not load
+OPTIONAL_MODULES = [
+    "dirtocgen.bounded",
+    "dirtocgen.index",
+    "dirtocgen.manifest",
+    "dirtocgen.shard",
+    "json",
+    "sqlite3",
+    "tempfile",
+]
+
+
+def _run_python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def _run_main_code(root_dir: str) -> str:
+    (Path(root_dir) / "README.md").write_text("# Root\n")
+    return f"import dirtocgen.__main__ as m; m.main([{root_dir!r}])"
+
+
+class TestMain(unittest.TestCase):
+    def test_import_time_within_budget(self):
+        # the fastest of a few runs, to be less sensitive to noise
+        cumulative_us = min(self._run_main_import_time() for _ in range(5))
+        self.assertLess(cumulative_us, IMPORT_TIME_BUDGET_US)
+
+    @staticmethod
+    def _run_main_import_time() -> int:
+        with TemporaryDirectory() as tmpd:
+            result = _run_python(_run_main_code(tmpd))
+
+        lines = result.stderr.splitlines()
+        start = next(
+            i for i, line in enumerate(lines) if line.endswith("| dirtocgen.__main__")
+        )
+        # modules imported at the top level from then on, with their cumulative times
+        return sum(
+            int(match.group(1))
+            for line in lines[start:]
+            if (match := re.match(r"^import time:\s+\d+ \|\s+(\d+) \| \S", line))
+        )
+
+    def test_plain_run_does_not_load_optional_modules(self):
+        with TemporaryDirectory() as tmpd:
+            result = _run_python(
+                f"import sys; {_run_main_code(tmpd)}; "
+                f"print([m for m in {OPTIONAL_MODULES!r} if m in sys.modules])"
+            )
+
+        self.assertEqual("[]", result.stdout.strip())
+
+    def test_import_does_not_load_usecase(self):
+        result = _run_python(
+            "import sys, dirtocgen.__main__; "
+            "print('dirtocgen.usecase' in sys.modules)"
+        )
+        self.assertEqual("False", result.stdout.strip())
+
+    def test_import_does_not_configure_logging(self):
+        result = _run_python(
+            "import logging, dirtocgen.usecase; "
+            "print(len(logging.getLogger().handlers))"
+        )
+        self.assertEqual("0", result.stdout.strip())
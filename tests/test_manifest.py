@@ -0,0 +1,96 @@
+import io
+import json
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from content_path import Scanner
+from manifest import (
+    ManifestEntry,
+    ManifestFormat,
+    ManifestWriter,
+    read_manifest,
+    scan_manifest_entries,
+)
+
+
+class TestManifest(unittest.TestCase):
+    def test_scan_manifest_entries(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "README.md").write_text("# Root")
+            (Path(tmpd) / "dir1").mkdir()
+            (Path(tmpd) / "dir1" / "doc.md").write_text("# Document")
+            (Path(tmpd) / "dummy.txt").touch()
+
+            entries = list(scan_manifest_entries(Scanner(), tmpd))
+
+            actual = [(e.path, e.depth, e.title, e.kind) for e in entries]
+            expect = [
+                (".", 0, "Root", "directory"),
+                ("dir1", 1, "dir1", "directory"),
+                ("dir1/doc.md", 2, "Document", "document"),
+            ]
+            self.assertEqual(expect, actual)
+            self.assertTrue(all(e.root == tmpd for e in entries))
+            self.assertEqual(
+                (Path(tmpd) / "dir1" / "doc.md").stat().st_mtime, entries[2].mtime
+            )
+
+    def test_scan_manifest_entries_with_broken_link(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "broken.md").symlink_to(Path(tmpd) / "missing.md")
+
+            entries = list(scan_manifest_entries(Scanner(), tmpd))
+
+            actual = [(e.path, e.title, e.kind) for e in entries[1:]]
+            self.assertEqual([("broken.md", "broken", "document")], actual)
+            self.assertEqual(
+                (Path(tmpd) / "broken.md").lstat().st_mtime, entries[1].mtime
+            )
+
+    def test_write_and_read(self):
+        entries = [
+            ManifestEntry("docs", ".", 0, "Root", "directory", 1.0),
+            ManifestEntry("docs", "doc.md", 1, "Document", "document", 2.0),
+        ]
+        for manifest_format in ManifestFormat:
+            with self.subTest(manifest_format=manifest_format):
+                f = io.StringIO()
+                writer = ManifestWriter(f, manifest_format)
+                for entry in entries:
+                    writer.write(entry)
+                writer.close()
+
+                f.seek(0)
+                self.assertEqual(entries, list(read_manifest(f)))
+
+    def test_write_ndjson_line_by_line(self):
+        f = io.StringIO()
+        writer = ManifestWriter(f, ManifestFormat.NDJSON)
+        writer.write(ManifestEntry("docs", ".", 0, "Root", "directory", 1.0))
+
+        # written before close
+        expect = (
+            '{"root": "docs", "path": ".", "depth": 0, "title": "Root", '
+            '"kind": "directory", "mtime": 1.0}\n'
+        )
+        self.assertEqual(expect, f.getvalue())
+
+    def test_write_json_entry_by_entry(self):
+        f = io.StringIO()
+        writer = ManifestWriter(f, ManifestFormat.JSON)
+        entry = ManifestEntry("docs", ".", 0, "Root\nline", "directory", 1.0)
+        writer.write(entry)
+
+        # written before close
+        self.assertIn('"title": "Root\\nline"', f.getvalue())
+
+        writer.close()
+        records = json.loads(f.getvalue())
+        self.assertEqual([entry], [ManifestEntry(**record) for record in records])
+
+    def test_write_json_without_entries(self):
+        f = io.StringIO()
+        ManifestWriter(f, ManifestFormat.JSON).close()
+
+        self.assertEqual([], json.loads(f.getvalue()))
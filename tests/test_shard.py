@@ -0,0 +1,20 @@
+import unittest
+
+from shard import Shard
+
+
+class TestShard(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(Shard(1, 4), Shard.parse("1/4"))
+
+    def test_parse_failed(self):
+        for spec in ["1", "a/4", "4/4", "1/0"]:
+            with self.subTest(spec=spec):
+                with self.assertRaises(ValueError):
+                    Shard.parse(spec)
+
+    def test_each_name_owned_by_exactly_one_shard(self):
+        shards = [Shard(i, 3) for i in range(3)]
+        for name in ["dir1", "dir2", "doc.md", "chapter10"]:
+            with self.subTest(name=name):
+                self.assertEqual(1, sum(shard.owns(name) for shard in shards))
@@ -1,3 +1,4 @@
+import io
 import os
 import unittest
 from dataclasses import dataclass
@@ -6,9 +7,18 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import Callable
 
-from usecase import insert_or_update_root_toc_and_create_or_update_children_index_docs
+from manifest import ManifestFormat, ManifestWriter, read_manifest
+from shard import Shard
+from usecase import (
+    MergeError,
+    Root,
+    insert_or_update_root_toc_and_create_or_update_children_index_docs,
+    insert_or_update_tocs_of_roots,
+    insert_or_update_tocs_of_roots_bounded,
+    merge_root_tocs,
+)
 
-from tests.helper import directory2string
+from tests.helper import directory2string, string2directory
 
 
 @dataclass
@@ -31,6 +41,31 @@ class TestUsecase(unittest.TestCase):
             "./tests/cases/update_root_toc",
             insert_or_update_root_toc_and_create_or_update_children_index_docs,
         ),
+        TestCase(
+            "nested_roots_use_depths_of_innermost_root",
+            "./tests/cases/nested_roots",
+            lambda d: insert_or_update_tocs_of_roots(
+                [Root(d, 1, 3), Root(os.path.join(d, "sub"), 2, 1)]
+            ),
+        ),
+        # max_memory=0 spills every toc line into temporary files
+        TestCase(
+            "insert_root_toc_and_create_child_index_doc_bounded",
+            "./tests/cases/insert_root_toc_and_create_child_index_doc",
+            lambda d: insert_or_update_tocs_of_roots_bounded([Root(d)], 0),
+        ),
+        TestCase(
+            "update_root_toc_and_ignore_hidden_doc_bounded",
+            "./tests/cases/update_root_toc",
+            lambda d: insert_or_update_tocs_of_roots_bounded([Root(d)], 0),
+        ),
+        TestCase(
+            "nested_roots_use_depths_of_innermost_root_bounded",
+            "./tests/cases/nested_roots",
+            lambda d: insert_or_update_tocs_of_roots_bounded(
+                [Root(d, 1, 3), Root(os.path.join(d, "sub"), 2, 1)], 0
+            ),
+        ),
     ]
 
     def test_nominal(self):
@@ -49,3 +84,133 @@ class TestUsecase(unittest.TestCase):
                         directory2string(expect_dir),
                         directory2string(tmpd),
                     )
+
+    def test_write_manifest_in_the_same_run(self):
+        with TemporaryDirectory() as tmpd:
+            case_dir = "./tests/cases/insert_root_toc_and_create_child_index_doc"
+            copy_tree(os.path.join(case_dir, "input"), tmpd)
+
+            f = io.StringIO()
+            manifest = ManifestWriter(f, ManifestFormat.NDJSON)
+            insert_or_update_tocs_of_roots([Root(tmpd)], manifest=manifest)
+
+            f.seek(0)
+            actual = [(e.path, e.title) for e in read_manifest(f)]
+            expect = [
+                (".", "Root index"),
+                ("dir1", "dir1"),
+                ("dir1/doc1.md", "Document 1"),
+            ]
+            self.assertEqual(expect, actual)
+
+    def test_shards_and_merge_equal_to_single_run(self):
+        tree = "\n".join(
+            [
+                "[FILE] README.md",
+                "# Root",
+                "[FILE] doc1.md",
+                "# Document 1",
+                "[FILE] doc2.md",
+                "# Document 2",
+            ]
+            + [f"[DIRECTORY] dir{i}\n[FILE] dir{i}/doc.md\n# Doc {i}" for i in range(8)]
+        )
+        with TemporaryDirectory() as expect_dir, TemporaryDirectory() as tmpd:
+            string2directory(expect_dir, tree)
+            insert_or_update_tocs_of_roots([Root(expect_dir, 2, 1)])
+
+            string2directory(tmpd, tree)
+            manifests = []
+            for i in range(3):
+                f = io.StringIO()
+                insert_or_update_tocs_of_roots(
+                    [Root(tmpd, 2, 1)],
+                    manifest=ManifestWriter(f),
+                    shard=Shard(i, 3),
+                )
+                f.seek(0)
+                manifests.append(f)
+
+            # shards do not touch the index doc of the root
+            self.assertEqual("# Root", (Path(tmpd) / "README.md").read_text())
+
+            entries = [entry for f in manifests for entry in read_manifest(f)]
+            merge_root_tocs([Root(tmpd, 2, 1)], entries)
+
+            self.assertEqual(directory2string(expect_dir), directory2string(tmpd))
+
+    def _write_shard_manifests(self, root_dir, count):
+        manifests = []
+        for i in range(count):
+            f = io.StringIO()
+            insert_or_update_tocs_of_roots(
+                [Root(root_dir, 2, 1)],
+                manifest=ManifestWriter(f),
+                shard=Shard(i, count),
+            )
+            f.seek(0)
+            manifests.append(list(read_manifest(f)))
+        return manifests
+
+    def test_merge_matches_roots_by_real_paths(self):
+        with TemporaryDirectory() as tmpd:
+            string2directory(
+                tmpd,
+                "[DIRECTORY] docs\n[FILE] docs/README.md\n# Docs\n"
+                "[FILE] docs/a.md\n# A",
+            )
+            root_dir = os.path.join(tmpd, "docs")
+            cwd = os.getcwd()
+            os.chdir(tmpd)
+            try:
+                # shards given the root as a relative path, and merge an absolute one
+                manifests = self._write_shard_manifests("docs", 2)
+                merge_root_tocs([Root(root_dir)], [e for m in manifests for e in m])
+            finally:
+                os.chdir(cwd)
+
+            self.assertIn("* [A](a.md)", (Path(root_dir) / "README.md").read_text())
+
+    def test_merge_without_all_shards(self):
+        with TemporaryDirectory() as tmpd:
+            string2directory(tmpd, "[FILE] README.md\n# Root\n[FILE] a.md\n# A")
+            manifests = self._write_shard_manifests(tmpd, 3)
+
+            for entries, message in [
+                ([], "no manifest entries"),
+                (manifests[0] + manifests[2], "shards missing .*: 1/3"),
+                (
+                    manifests[0] + self._write_shard_manifests(tmpd, 2)[1],
+                    "different numbers of shards",
+                ),
+            ]:
+                with self.subTest(message=message):
+                    with self.assertRaisesRegex(MergeError, message):
+                        merge_root_tocs([Root(tmpd)], entries)
+
+                    self.assertEqual("# Root", (Path(tmpd) / "README.md").read_text())
+
+    def test_created_index_doc_titles_appear_in_parent_toc(self):
+        with TemporaryDirectory() as tmpd:
+            (Path(tmpd) / "README.md").write_text("# Root\n")
+            (Path(tmpd) / "v1.2").mkdir()
+
+            insert_or_update_tocs_of_roots([Root(tmpd)])
+
+            # the title of the created index doc, rather than the stem "v1"
+            self.assertIn("* [v1.2](v1.2)", (Path(tmpd) / "README.md").read_text())
+
+    def test_root_without_index_doc(self):
+        for sut in [
+            lambda d: insert_or_update_tocs_of_roots([Root(d)]),
+            lambda d: insert_or_update_tocs_of_roots_bounded([Root(d)], 0),
+            lambda d: merge_root_tocs([Root(d)], []),
+        ]:
+            with self.subTest(sut=sut), TemporaryDirectory() as tmpd:
+                (Path(tmpd) / "dir1").mkdir()
+
+                with self.assertRaises(FileNotFoundError):
+                    sut(tmpd)
+
+                # failed before writing anything
+                self.assertEqual([], list(Path(tmpd).rglob("README.md")))